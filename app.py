@@ -1,18 +1,57 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
 from dotenv import load_dotenv
 from audio_io import tts_save_to_file, transcribe_file
-from db import load_books_into_chroma
+from db import load_books_into_chroma, load_recommendation_cache
 from moderation import moderate_or_pass
+from openai_client import warm_up
 from rag import retrieval_candidates
 from llm import make_llm_recommendation
 from image_generation import spawn_image_job
 
 load_dotenv()
 
+# query-path work (retrieval, connection warm-up) gets its own pool, so it never
+# queues behind the multi-second media jobs (TTS, image generation)
+_QUERY_POOL = ThreadPoolExecutor(max_workers=2)
+_MEDIA_POOL = ThreadPoolExecutor(max_workers=4)
+
+
+def _print_token(token: str) -> None:
+    print(token, end="", flush=True)
+
+
+def _tts_job(answer: str, book_title: str) -> str:
+    try:
+        out_path = tts_save_to_file(answer, book_title)
+        return f"Assistant: Audio saved to {out_path}\n"
+    except Exception as e:
+        return f"Assistant: Could not synthesize audio ({e}).\n"
+
+
+def _report_finished(jobs: List[Future]) -> List[Future]:
+    """
+    Print the reports of finished media jobs and return the ones still running.
+    """
+    running = []
+    for job in jobs:
+        if job.done():
+            print(job.result())
+        else:
+            running.append(job)
+    return running
+
 
 def main():
     coll = load_books_into_chroma()
+    rec_cache = load_recommendation_cache()
+    # open the OpenAI connection in the background so the first query skips the handshake
+    _QUERY_POOL.submit(warm_up)
 
+    media_jobs: List[Future] = []
     while True:
+        # media jobs report between turns instead of printing over the prompt
+        media_jobs = _report_finished(media_jobs)
         user_q = input("Your input: ").strip()
         if not user_q:
             continue
@@ -32,39 +71,53 @@ def main():
                 print(f"Assistant: Could not transcribe audio ({e}).\n")
                 continue
 
-        # prompt moderation part
+        # prompt moderation part, overlapped with retrieval (discarded if flagged)
+        retrieval = _QUERY_POOL.submit(retrieval_candidates, coll, user_q, k=5)
         warning = moderate_or_pass(user_q)
         if warning:
+            retrieval.cancel()
             print(f"Assistant: {warning}\n")
             continue
 
-        candidates = retrieval_candidates(coll, user_q, k=5)
-        recommendation, chosen_title, summary = make_llm_recommendation(user_q, candidates)
+        candidates = retrieval.result()
 
-        # text answer generation part
+        # text answer generation part, printed as the tokens stream in
+        print("Assistant: ", end="", flush=True)
+        recommendation, chosen_title, summary = make_llm_recommendation(
+            user_q, candidates, cache_coll=rec_cache, on_token=_print_token
+        )
         answer = recommendation
         if chosen_title and summary:
-            answer += f"\n\nRezumat complet pentru {chosen_title}:\n{summary}"
+            full_summary = f"\n\nRezumat complet pentru {chosen_title}:\n{summary}"
+            answer += full_summary
+            print(full_summary, end="")
 
-        print(f"Assistant: {answer}\n")
+        print("\n")
 
-        # text-to-speech part
+        # ask for both media outputs first, so TTS and image generation run concurrently
         choice_tts = input("Generate audio for this answer? [y/n]: ").strip().lower()
+        choice_image_gen = "n"
+        if chosen_title:
+            choice_image_gen = input("Generate an image for this recommendation? [y/n]: ").strip().lower()
+
+        # the next query can be typed while these run; their reports print before a later prompt
+        # text-to-speech part
         if choice_tts == "y":
-            try:
-                book_title = chosen_title or "default.mp3"
-                out_path = tts_save_to_file(answer, book_title)
-                print(f"Assistant: Audio saved to {out_path}\n")
-            except Exception as e:
-                print(f"Assistant: Could not synthesize audio ({e}).\n")
+            book_title = chosen_title or "default.mp3"
+            media_jobs.append(_MEDIA_POOL.submit(_tts_job, answer, book_title))
 
         # image generation part
-        if chosen_title:
-            choice_image_gen = input("Generate an image for this recommendation? [y/n]: ").strip().lower()
-            if choice_image_gen == "y":
-                safe_name = chosen_title.replace(" ", "_").replace("/", "_").lower() # remove annoying characters from file name
-                print(f"Generating image {safe_name}.png...\n")
-                spawn_image_job(chosen_title, summary, safe_name)
+        if choice_image_gen == "y":
+            safe_name = chosen_title.replace(" ", "_").replace("/", "_").lower() # remove annoying characters from file name
+            print(f"Generating image {safe_name}.png...\n")
+            media_jobs.append(spawn_image_job(chosen_title, summary, safe_name, _MEDIA_POOL))
+
+        # keep the OpenAI connection warm while the user types the next query
+        _QUERY_POOL.submit(warm_up)
+
+    # let pending media jobs finish and report before exiting
+    for job in media_jobs:
+        print(job.result())
 
 
 if __name__ == "__main__":
@@ -1,6 +1,8 @@
 from pathlib import Path
 from typing import Optional
-from openai import OpenAI
+from openai_client import get_client
+
+_TTS_CHUNK_SIZE = 64 * 1024
 
 def transcribe_file(audio_path: str, model: str = "whisper-1", language: Optional[str] = None) -> str:
     """
@@ -10,9 +12,9 @@ def transcribe_file(audio_path: str, model: str = "whisper-1", language: Optiona
     if not p.exists():
         raise FileNotFoundError(f"Audio file not found: {audio_path}")
 
-    _client = OpenAI()
+    client = get_client()
     with p.open("rb") as f:
-        resp = _client.audio.transcriptions.create(
+        resp = client.audio.transcriptions.create(
             model=model,
             file=f,
             language=language,
@@ -26,21 +28,29 @@ def tts_save_to_file(
     voice: str = "alloy",
     audio_format: str = "mp3",
     model: str = "gpt-4o-mini-tts",
+    out_path: Optional[str] = None,
 ) -> str:
     """
     Convert text to speech and save to an audio file using streaming.
+
+    The file goes to out_path if given, otherwise to
+    "<book_title>_recommendation.<audio_format>" in the working directory.
     """
-    client = OpenAI()
-    safe_name = book_title.replace(" ", "_").replace("/", "_").lower()
-    out = Path(f"{safe_name}_recommendation.{audio_format}")
+    client = get_client()
+    if out_path:
+        out = Path(out_path)
+    else:
+        safe_name = book_title.replace(" ", "_").replace("/", "_").lower()
+        out = Path(f"{safe_name}_recommendation.{audio_format}")
 
     with client.audio.speech.with_streaming_response.create(
         model=model,
         voice=voice,
         input=text,
         response_format=audio_format,
-    ) as response:
-        response.stream_to_file(str(out))
+    ) as response, out.open("wb") as f:
+        for chunk in response.iter_bytes(chunk_size=_TTS_CHUNK_SIZE):
+            f.write(chunk)
 
     return str(out.resolve())
 
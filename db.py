@@ -1,47 +1,127 @@
+from functools import lru_cache
+import re
 import chromadb
-from chromadb.utils import embedding_functions
-import os
+from openai_client import get_client
 
-def parse_books(txt_path):
-    titles, summaries = [], []
-    current_title, current_summary_lines = None, []
+_EMBED_MODEL = "text-embedding-3-small"
+# Chroma handles 50-250 records per add() best; one embeddings request per batch
+_BATCH_SIZE = 200
+_TITLE_HEADER = re.compile(r"^## Title:", re.MULTILINE)
+# snippets are precomputed at ingest and stored in the metadata
+SNIPPET_LEN = 220
+# HNSW index settings, applied when a collection is first created
+_HNSW_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 16,
+    "hnsw:construction_ef": 100,
+    "hnsw:search_ef": 64,
+}
+_LINE_BREAKS = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+_NON_SPACE = re.compile(r"\S")
 
+def parse_books(txt_path):
     with open(txt_path, "r", encoding="utf-8") as f:
-        for line in (l.rstrip("\n") for l in f):
-            if line.startswith("## Title:"):
-                if current_title is not None:
-                    titles.append(current_title)
-                    summaries.append("\n".join(current_summary_lines).strip())
-                    current_summary_lines = []
-                current_title = line[len("## Title:"):].strip()
-            else:
-                current_summary_lines.append(line)
-
-    if current_title is not None:
-        titles.append(current_title)
-        summaries.append("\n".join(current_summary_lines).strip())
+        content = f.read()
+
+    # one regex pass splits the file into "<title>\n<summary>" blocks;
+    # anything before the first header is dropped
+    blocks = _TITLE_HEADER.split(content)[1:]
+
+    titles, summaries = [], []
+    for block in blocks:
+        title, _, summary = block.partition("\n")
+        titles.append(title.strip())
+        summaries.append(summary.strip())
 
     return titles, summaries
 
 
+def make_snippet(text, max_len=SNIPPET_LEN):
+    """
+    Build a compact one-line snippet from a longer document string.
+
+    Only the first max_len characters are normalised, so the cost does not
+    grow with the document length.
+    """
+    if not text:
+        return ""
+    text = text.lstrip()
+    head = text[:max_len].translate(_LINE_BREAKS).rstrip()
+    # truncated only if something other than whitespace follows the head
+    if len(text) <= max_len or _NON_SPACE.search(text, max_len) is None:
+        return head
+    return head + "..."
+
+
+def embed_texts(texts):
+    """
+    Embed a list of texts with a single OpenAI embeddings request.
+    """
+    resp = get_client().embeddings.create(model=_EMBED_MODEL, input=texts)
+    return [d.embedding for d in resp.data]
+
+
+def embed_query(text):
+    """
+    Embed a single query; identical (stripped) texts reuse the cached vector.
+    """
+    return _embed_query_cached(text.strip())
+
+
+@lru_cache(maxsize=1024)
+def _embed_query_cached(text):
+    return embed_texts([text])[0]
+
+
+@lru_cache(maxsize=None)
+def _chroma_client(db_path):
+    """
+    Open the persistent Chroma store at db_path once per process.
+    """
+    return chromadb.PersistentClient(path=db_path)
+
+
 def load_books_into_chroma(txt_path="books_summaries.txt", db_path="./chroma_db", collection_name="books"):
     titles, docs = parse_books(txt_path)
 
-    ef = embedding_functions.OpenAIEmbeddingFunction(
-        api_key=os.environ["OPENAI_API_KEY"],
-        model_name="text-embedding-3-small"
-    )
+    # no embedding_function: documents and queries are embedded via embed_texts
+    client = _chroma_client(db_path)
+    coll = client.get_or_create_collection(collection_name, metadata=_HNSW_METADATA)
 
-    client = chromadb.PersistentClient(path=db_path)
-    coll = client.get_or_create_collection(collection_name, embedding_function=ef)
+    # Titles act as IDs; embed outside Chroma so each batch is one API call
+    metadatas = [{"title": t, "snippet": make_snippet(d)} for t, d in zip(titles, docs)]
+    count = coll.count()
+    if count:
+        first = coll.get(limit=1, include=["metadatas"])["metadatas"]
+        if first and "snippet" not in (first[0] or {}):
+            # store created before snippets lived in the metadata
+            coll.update(ids=titles, metadatas=metadatas)
 
-    # Titles act as IDs
-    if coll.count() == 0:
-        coll.add(documents=docs, ids=titles)
+    # the store persists across restarts: only embed books it does not have yet
+    if count < len(titles):
+        existing = set(coll.get(ids=titles, include=[])["ids"]) if count else set()
+        missing = [i for i, t in enumerate(titles) if t not in existing]
+        for start in range(0, len(missing), _BATCH_SIZE):
+            batch = missing[start:start + _BATCH_SIZE]
+            batch_docs = [docs[i] for i in batch]
+            coll.add(
+                documents=batch_docs,
+                ids=[titles[i] for i in batch],
+                metadatas=[metadatas[i] for i in batch],
+                embeddings=embed_texts(batch_docs),
+            )
 
     return coll
 
 
+def load_recommendation_cache(db_path="./chroma_db", collection_name="rec_cache"):
+    """
+    Open the on-disk semantic cache of past (query embedding -> recommendation) pairs.
+    """
+    client = _chroma_client(db_path)
+    return client.get_or_create_collection(collection_name, metadata=_HNSW_METADATA)
+
+
 if __name__ == "__main__":
     collection = load_books_into_chroma()
     print(f"Loaded {collection.count()} books into ChromaDB.")
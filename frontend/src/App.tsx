@@ -8,10 +8,19 @@ type ChatResponse = {
   summary?: string;
 };
 
-type ImageResponse = { image_url: string };
-type TTSResponse = { audio_url: string };
+type JobResponse = {
+  job_id: string;
+  status: "pending" | "done" | "error";
+  url?: string;
+  error?: string;
+  status_url?: string;
+};
 type STTResponse = { text: string };
 
+const JOB_POLL_MS = 1000;
+// give up polling after ~10 minutes (matches the server's job timeout)
+const JOB_MAX_POLLS = 600;
+
 async function postJSON<T>(path: string, body: unknown): Promise<T> {
   const res = await fetch(`${BASE_URL}${path}`, {
     method: "POST",
@@ -22,6 +31,24 @@ async function postJSON<T>(path: string, body: unknown): Promise<T> {
   return res.json() as Promise<T>;
 }
 
+async function getJSON<T>(path: string): Promise<T> {
+  const res = await fetch(`${BASE_URL}${path}`);
+  if (!res.ok) throw new Error(`HTTP ${res.status}: ${await res.text()}`);
+  return res.json() as Promise<T>;
+}
+
+/** poll a queued media job until its file is ready; resolves to the file URL */
+async function waitForJob(job: JobResponse): Promise<string> {
+  const statusUrl = job.status_url || `/api/jobs/${encodeURIComponent(job.job_id)}`;
+  for (let polls = 0; job.status === "pending"; polls++) {
+    if (polls >= JOB_MAX_POLLS) throw new Error("Job timed out");
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+    job = await getJSON<JobResponse>(statusUrl);
+  }
+  if (job.status !== "done" || !job.url) throw new Error(job.error || "Job failed");
+  return `${BASE_URL}${job.url}`;
+}
+
 async function postForm<T>(path: string, form: FormData): Promise<T> {
   const res = await fetch(`${BASE_URL}${path}`, { method: "POST", body: form });
   if (!res.ok) throw new Error(`HTTP ${res.status}: ${await res.text()}`);
@@ -84,11 +111,11 @@ export default function App() {
     setError(null);
     setImageUrl(undefined);
     try {
-      const res = await postJSON<ImageResponse>("/api/image", {
+      const job = await postJSON<JobResponse>("/api/image", {
         title: chosenTitle,
         summary,
       });
-      setImageUrl(`${BASE_URL}${res.image_url}`);
+      setImageUrl(await waitForJob(job));
     } catch (e: any) {
       setError(e.message || "Image generation failed");
     } finally {
@@ -103,8 +130,8 @@ export default function App() {
     setError(null);
     setAudioUrl(undefined);
     try {
-      const res = await postJSON<TTSResponse>("/api/tts", { text: answer });
-      setAudioUrl(`${BASE_URL}${res.audio_url}`);
+      const job = await postJSON<JobResponse>("/api/tts", { text: answer });
+      setAudioUrl(await waitForJob(job));
     } catch (e: any) {
       setError(e.message || "TTS failed");
     } finally {
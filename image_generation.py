@@ -1,24 +1,45 @@
 import base64
+import os
+from concurrent.futures import Executor, Future
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
-from openai import OpenAI
-import threading
+import httpx
+from openai_client import get_client
 
-_IMG_SIZE = "1024x1024"
+_DOWNLOAD_TIMEOUT = 60.0
 
-def spawn_image_job(title: str, summary: str, filename: str) -> None:
-    """fire-and-forget image generation to avoid blocking the text output."""
-    def _job():
+
+def default_image_size() -> str:
+    """
+    Image size from SL_IMG_SIZE, read per call so a .env loaded after import still applies.
+    gpt-image-1 accepts 1024x1024, 1536x1024, 1024x1536 or auto; dall-e-2 also takes 256x256/512x512.
+    """
+    return os.getenv("SL_IMG_SIZE", "1024x1024")
+
+
+def spawn_image_job(
+    title: str,
+    summary: str,
+    filename: str,
+    pool: Executor,
+    size: Optional[str] = None,
+) -> Future:
+    """
+    submit image generation to the pool to avoid blocking the text output.
+    The future resolves to a one-line report, printed when the caller chooses.
+    """
+    def _job() -> str:
         try:
-            print(f"[DEBUG] Starting image gen: {title} -> {filename}.png")
             img_prompt = prompt_from_book(title, summary)
-            path = generate_image_to_file(img_prompt, out_path=f"{filename}.png", size=_IMG_SIZE)
-            print(f"[DEBUG] Finished image gen: {path}")
+            path = generate_image_to_file(img_prompt, out_path=f"{filename}.png", size=size)
+            return f"[DEBUG] Finished image gen: {path}"
         except Exception as e:
-            print(f"[ERROR] Image generation failed: {e}")
-    threading.Thread(target=_job, daemon=True).start()
+            return f"[ERROR] Image generation failed: {e}"
+    return pool.submit(_job)
 
 
+@lru_cache(maxsize=128)
 def prompt_from_book(title: str, summary: str, style_hint: Optional[str] = None) -> str:
     """
     Build a concise, descriptive prompt for image generation from a book title & summary.
@@ -37,22 +58,32 @@ def prompt_from_book(title: str, summary: str, style_hint: Optional[str] = None)
 def generate_image_to_file(
     prompt: str,
     out_path: str = "book_image.png",
-    size: str = "1024x1024",
+    size: Optional[str] = None,
     model: str = "gpt-image-1",
 ) -> str:
     """
     Generate an image from a text prompt and save it as a PNG.
+
+    dall-e models are asked for a URL and the PNG is streamed straight to disk;
+    gpt-image-1 only returns base64, which is decoded as before.
     """
     out_path = str(Path(out_path).with_suffix(".png"))
-    _client = OpenAI()
-    result = _client.images.generate(
+    client = get_client()
+    extra = {"response_format": "url"} if model.startswith("dall-e") else {}
+    result = client.images.generate(
         model=model,
         prompt=prompt,
-        size=size
+        size=size or default_image_size(),
+        **extra,
     )
 
-    image_b64 = result.data[0].b64_json
-    image_bytes = base64.b64decode(image_b64)
-    with open(out_path, "wb") as f:
-        f.write(image_bytes)
+    image = result.data[0]
+    if image.url:
+        with httpx.stream("GET", image.url, timeout=_DOWNLOAD_TIMEOUT) as r, open(out_path, "wb") as f:
+            r.raise_for_status()
+            for chunk in r.iter_bytes():
+                f.write(chunk)
+    else:
+        with open(out_path, "wb") as f:
+            f.write(base64.b64decode(image.b64_json))
     return str(Path(out_path).resolve())
@@ -1,7 +1,29 @@
-from typing import List, Dict, Tuple, Optional
-from openai import OpenAI
+import hashlib
+import re
+from typing import Callable, List, Dict, Tuple, Optional
+from openai_client import get_client
+from db import embed_query
 from llm_tools import get_summary_by_title
 
+# cosine distance under which a cached recommendation is reused
+_CACHE_MAX_DISTANCE = 0.05
+
+_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are a helpful literary assistant. "
+        "Your output MUST be in the same language as the user input in user_query. "
+        "You receive the user's request and a list of candidate books. "
+        "Choose one and explain briefly (2–4 reasons)."
+    ),
+}
+
+_USER_TEMPLATE = (
+    "Cerere: {query}\n\n"
+    "Candidați:\n{context}\n\n"
+    "Alege cea mai potrivită carte și explică pe scurt de ce."
+)
+
 
 def _build_messages(user_query: str, candidates: List[Dict[str, str]]) -> list:
     """
@@ -10,50 +32,91 @@ def _build_messages(user_query: str, candidates: List[Dict[str, str]]) -> list:
     We give the user request and candidate list,
     and ask for a recommendation in Romanian.
     """
-    system_msg = (
-        "You are a helpful literary assistant. "
-        "Your output MUST be in the same language as the user input in user_query. "
-        "You receive the user's request and a list of candidate books. "
-        "Choose one and explain briefly (2–4 reasons)."
-    )
+    context = "\n".join(f"- {c['title']}: {c['snippet']}" for c in candidates)
+    user_msg = _USER_TEMPLATE.format(query=user_query, context=context)
+    return [_SYSTEM_MESSAGE, {"role": "user", "content": user_msg}]
 
-    context_lines = [f"- {c['title']}: {c['snippet']}" for c in candidates]
-    context_block = "Candidați:\n" + "\n".join(context_lines)
 
-    user_msg = (
-        f"Cerere: {user_query}\n\n"
-        f"{context_block}\n\n"
-        "Alege cea mai potrivită carte și explică pe scurt de ce."
-    )
+def _find_first_title(text: str, titles: List[str]) -> Optional[str]:
+    """
+    Return the candidate title mentioned earliest in text (case-insensitive).
 
-    return [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": user_msg},
-    ]
+    All titles are matched in one regex pass instead of one substring scan per title.
+    """
+    by_lower = {t.lower(): t for t in titles if t}
+    if not by_lower:
+        return None
+    # longest first, so a title wins over a shorter title it contains
+    pattern = "|".join(re.escape(t) for t in sorted(by_lower, key=len, reverse=True))
+    m = re.search(pattern, text, flags=re.IGNORECASE)
+    return by_lower.get(m.group(0).lower()) if m else None
 
 
-def make_llm_recommendation(user_query: str, candidates: List[Dict[str, str]]) -> Tuple[str, Optional[str], Optional[str]]:
+def _cached_recommendation(cache_coll, query_emb: List[float]) -> Optional[Tuple[str, Optional[str]]]:
     """
-    Generate a recommendation in Romanian, then append the full summary
+    Return (recommendation, chosen_title) for a near-duplicate past query, if any.
     """
-    client = OpenAI()
+    if cache_coll.count() == 0:
+        return None
+    res = cache_coll.query(
+        query_embeddings=[query_emb],
+        n_results=1,
+        include=["documents", "metadatas", "distances"],
+    )
+    dists = (res.get("distances") or [[]])[0]
+    if not dists or dists[0] >= _CACHE_MAX_DISTANCE:
+        return None
+    meta = (res.get("metadatas") or [[]])[0][0] or {}
+    return res["documents"][0][0], meta.get("title") or None
+
+
+def make_llm_recommendation(
+    user_query: str,
+    candidates: List[Dict[str, str]],
+    cache_coll=None,
+    on_token: Optional[Callable[[str], None]] = None,
+) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Generate a recommendation in Romanian, then append the full summary.
+
+    If cache_coll (see db.load_recommendation_cache) is given, semantically
+    near-identical queries reuse a previously generated recommendation.
+    The completion is streamed; on_token, if given, receives each text
+    delta as it arrives.
+    """
+    query_emb = None
+    if cache_coll is not None:
+        query_emb = embed_query(user_query)
+        hit = _cached_recommendation(cache_coll, query_emb)
+        if hit:
+            recommendation, chosen_title = hit
+            if on_token:
+                on_token(recommendation)
+            summary = get_summary_by_title(chosen_title) if chosen_title else None
+            return recommendation, chosen_title, summary
+
+    client = get_client()
     messages = _build_messages(user_query, candidates)
 
-    resp = client.chat.completions.create(
+    stream = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         temperature=0.7,
+        stream=True,
     )
-    recommendation = resp.choices[0].message.content or ""
+    parts: List[str] = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        if delta:
+            parts.append(delta)
+            if on_token:
+                on_token(delta)
+    recommendation = "".join(parts)
 
     # try to detect which candidate title appears in the LLM recommendation
-    chosen_title = None
-    rec_lower = recommendation.lower()
-    for c in candidates:
-        title = c["title"]
-        if title.lower() in rec_lower:
-            chosen_title = title
-            break
+    chosen_title = _find_first_title(recommendation, [c["title"] for c in candidates])
 
     # if nothing matched, use the top candidate
     if not chosen_title and candidates:
@@ -63,4 +126,12 @@ def make_llm_recommendation(user_query: str, candidates: List[Dict[str, str]]) -
     if chosen_title:
         summary = get_summary_by_title(chosen_title)
 
-    return recommendation, chosen_title, summary
\ No newline at end of file
+    if cache_coll is not None and recommendation:
+        cache_coll.upsert(
+            ids=[hashlib.sha1(user_query.encode("utf-8")).hexdigest()],
+            embeddings=[query_emb],
+            documents=[recommendation],
+            metadatas=[{"title": chosen_title or ""}],
+        )
+
+    return recommendation, chosen_title, summary
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import Dict
 
 # Local dictionary of book summaries.
@@ -48,6 +49,7 @@ book_summaries_dict: Dict[str, str] = {
 }
 
 
+@lru_cache(maxsize=128)
 def get_summary_by_title(title: str) -> str:
     """
     Look up and return the full summary for an EXACT book title.
@@ -1,7 +1,9 @@
+from collections import OrderedDict
 from enum import Enum
+import threading
 from typing import Optional
 from pydantic import BaseModel
-from openai import OpenAI
+from openai_client import get_client
 
 class Category(str, Enum):
     violence = "violence"
@@ -16,30 +18,69 @@ class ContentCompliance(BaseModel):
     explanation_if_violating: Optional[str]
 
 
+# omni-moderation category prefixes -> our categories
+_CATEGORY_MAP = {
+    "violence": Category.violence,
+    "sexual": Category.sexual,
+    "self-harm": Category.self_harm,
+    "harassment": Category.offensive,
+    "hate": Category.offensive,
+    "illicit": Category.offensive,
+}
+
+# LRU of verdicts keyed by the normalised message (stripped, lower-cased)
+_VERDICT_CACHE_SIZE = 1024
+_VERDICT_CACHE: "OrderedDict[str, ContentCompliance]" = OrderedDict()
+_VERDICT_CACHE_LOCK = threading.Lock()
+
+
 def check_message_compliance(message: str) -> ContentCompliance:
     """
-    Ask the model to classify the user message.
+    Classify the user message with OpenAI's moderation endpoint.
+
+    The original text is sent to the classifier; verdicts are cached per
+    normalised message (stripped, lower-cased).
     """
-    client = OpenAI()
-    response = client.responses.parse(
-        model="gpt-4o-2024-08-06",
-        input=[
-            {
-                "role": "system",
-                "content": (
-                    "Determine if the user input violates any of these categories: "
-                    "violence, sexual, self_harm, offensive. "
-                    "The 'offensive' category includes profanity, slurs, hate/harassment, "
-                    "demeaning insults, or otherwise abusive/derogatory language. "
-                    "If violating, set is_violating=true, provide the best-fitting category "
-                    "and a brief explanation. If not, set is_violating=false."
-                ),
-            },
-            {"role": "user", "content": message},
-        ],
-        text_format=ContentCompliance,
+    key = message.strip().lower()
+    with _VERDICT_CACHE_LOCK:
+        cached = _VERDICT_CACHE.get(key)
+        if cached is not None:
+            _VERDICT_CACHE.move_to_end(key)
+            return cached
+
+    verdict = _classify(message)
+    with _VERDICT_CACHE_LOCK:
+        _VERDICT_CACHE[key] = verdict
+        if len(_VERDICT_CACHE) > _VERDICT_CACHE_SIZE:
+            _VERDICT_CACHE.popitem(last=False)
+    return verdict
+
+
+def _classify(message: str) -> ContentCompliance:
+    client = get_client()
+    response = client.moderations.create(model="omni-moderation-latest", input=message)
+    result = response.results[0]
+    if not result.flagged:
+        return ContentCompliance(is_violating=False, category=None, explanation_if_violating=None)
+
+    # e.g. {"self-harm/intent": True, ...}; keep the flagged ones, highest score first
+    flags = result.categories.model_dump(by_alias=True)
+    scores = result.category_scores.model_dump(by_alias=True)
+    flagged = sorted(
+        (name for name, hit in flags.items() if hit),
+        key=lambda name: scores.get(name) or 0.0,
+        reverse=True,
+    )
+
+    category = next(
+        (_CATEGORY_MAP[name.split("/")[0]] for name in flagged if name.split("/")[0] in _CATEGORY_MAP),
+        Category.offensive,
+    )
+    return ContentCompliance(
+        is_violating=True,
+        category=category,
+        explanation_if_violating="Flagged by moderation: " + ", ".join(flagged),
     )
-    return response.output_parsed
 
 
 def moderate_or_pass(message: str) -> Optional[str]:
@@ -0,0 +1,28 @@
+import threading
+from typing import Optional
+from openai import OpenAI
+
+_CLIENT: Optional[OpenAI] = None
+_LOCK = threading.Lock()
+
+
+def get_client() -> OpenAI:
+    """
+    Return the process-wide OpenAI client, creating it on first use.
+
+    Sharing one client keeps a single HTTP connection pool, so later calls
+    reuse warm keep-alive connections instead of redoing the TLS handshake.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _LOCK:
+            if _CLIENT is None:
+                _CLIENT = OpenAI()
+    return _CLIENT
+
+
+def warm_up() -> None:
+    """
+    Issue a cheap request so the shared client has a live keep-alive connection.
+    """
+    get_client().models.list()
@@ -1,14 +1,99 @@
-from typing import List, Dict, Any
+from collections import OrderedDict
+from itertools import zip_longest
+import threading
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
+import numpy as np
+from db import SNIPPET_LEN, embed_query, make_snippet
 
+# collections up to this size are searched with an in-memory matrix product
+# instead of a Chroma HNSW query
+_DENSE_MAX = 10_000
+# larger collections fetch this many times k ANN hits and rerank them exactly
+_RERANK_OVERSAMPLE = 4
 
-def _make_snippet(text: str, max_len: int = 220) -> str:
+
+class _DenseIndex(NamedTuple):
+    ids: List[str]
+    metas: List[Any]
+    matrix: np.ndarray  # (N, dim) int8, quantised L2-normalised rows
+    scales: np.ndarray  # (N,) float32, row i ~= matrix[i] / scales[i]
+
+
+_DENSE_INDEXES: Dict[str, _DenseIndex] = {}
+
+# LRU of finished results keyed by (collection id, normalised query, k, snippet_len)
+_RESULT_CACHE_SIZE = 1024
+_RESULT_CACHE: "OrderedDict[Tuple[str, str, int, int], List[Dict[str, Any]]]" = OrderedDict()
+_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def _quantize(x: np.ndarray):
+    """
+    Symmetric per-row int8 quantisation: returns (int8 values, scale = 127 / max|row|).
+    """
+    absmax = np.abs(x).max(axis=-1, keepdims=True)
+    scales = 127.0 / np.maximum(absmax, 1e-12)
+    q = np.rint(x * scales).astype(np.int8)
+    return q, np.squeeze(scales, axis=-1).astype(np.float32)
+
+
+def _dense_index(coll) -> Optional[_DenseIndex]:
+    """
+    Load (once per collection) all stored embeddings into a normalised int8 matrix.
+    """
+    key = str(coll.id)
+    index = _DENSE_INDEXES.get(key)
+    if index is None:
+        n = coll.count()
+        if n == 0 or n > _DENSE_MAX:
+            return None
+        data = coll.get(include=["embeddings", "metadatas"])
+        matrix = np.asarray(data["embeddings"], dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        quantized, scales = _quantize(matrix)
+        index = _DenseIndex(
+            ids=list(data["ids"]),
+            metas=list(data.get("metadatas") or []),
+            matrix=quantized,
+            scales=scales,
+        )
+        _DENSE_INDEXES[key] = index
+    return index
+
+
+def _dense_query(index: _DenseIndex, query_emb: List[float], k: int):
     """
-    Build a compact one-line snippet from a longer document string.
+    Exact top-k by cosine similarity; returns (ids, metas, cosine distances).
     """
-    if not text:
-        return ""
-    one_line = text.replace("\n", " ").strip()
-    return one_line if len(one_line) <= max_len else one_line[:max_len].rstrip() + "..."
+    q = np.asarray(query_emb, dtype=np.float32)
+    q8, q_scale = _quantize(q / np.linalg.norm(q))
+    # int8 x int8 dot products accumulated in int32, then rescaled to cosine similarity
+    scores = np.einsum("ij,j->i", index.matrix, q8, dtype=np.int32) / (index.scales * q_scale)
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return (
+        [index.ids[i] for i in top],
+        [index.metas[i] for i in top] if index.metas else [],
+        (1.0 - scores[top]).tolist(),
+    )
+
+
+def _rerank(query_emb: List[float], ids: List[str], metas: List[Any], embeddings, k: int):
+    """
+    Exact cosine top-k over oversampled ANN hits; returns (ids, metas, cosine distances).
+    """
+    if not len(ids):
+        return [], [], []
+    x = np.asarray(embeddings, dtype=np.float32)
+    q = np.asarray(query_emb, dtype=np.float32)
+    sims = (x @ q) / (np.linalg.norm(x, axis=1) * np.linalg.norm(q))
+    order = np.argsort(-sims)[:k]
+    return (
+        [ids[i] for i in order],
+        [metas[i] for i in order] if metas else [],
+        (1.0 - sims[order]).tolist(),
+    )
 
 
 def retrieval_candidates(
@@ -28,7 +113,8 @@ def retrieval_candidates(
     k : int
         Number of results to return (top-K)
     snippet_len : int
-        Maximum length of the text snippet for each candidate
+        Maximum length of the text snippet for each candidate (snippets are
+        precomputed at ingest, so this cannot exceed db.SNIPPET_LEN)
 
     Returns
     -------
@@ -37,41 +123,70 @@ def retrieval_candidates(
         [
           {
             "title": str,      # book title
-            "snippet": str,    # short preview from the stored document
+            "snippet": str,    # short preview stored in the metadata at ingest
             "distance": float, # vector distance (smaller = closer match)
             "id": str          # the raw Chroma ID
           },
           ...
         ]
+
+    Results are cached in-process per collection and normalised query text,
+    so a repeated question skips the embedding call and the vector search.
     """
-    res = coll.query(
-        query_texts=[query_text],
-        n_results=k,
-        include=["documents", "metadatas", "distances"],
-    )
+    key = (str(coll.id), query_text.strip().lower(), k, snippet_len)
+    with _RESULT_CACHE_LOCK:
+        cached = _RESULT_CACHE.get(key)
+        if cached is not None:
+            _RESULT_CACHE.move_to_end(key)
+            return list(cached)
 
-    ids = (res.get("ids") or [[]])[0]
-    docs = (res.get("documents") or [[]])[0]
-    metas = (res.get("metadatas") or [[]])[0]
-    dists = (res.get("distances") or [[]])[0]
-
-    out: List[Dict[str, Any]] = []
-    for i in range(len(ids)):
-        doc_id = ids[i]
-        doc_text = docs[i] if i < len(docs) else ""
-        meta = metas[i] if i < len(metas) and isinstance(metas[i], dict) else {}
-        dist = dists[i] if i < len(dists) else None
-
-        title = meta.get("title") or doc_id
-        snippet = _make_snippet(doc_text, max_len=snippet_len)
-
-        out.append(
-            {
-                "title": title,
-                "snippet": snippet,
-                "distance": dist,
-                "id": doc_id,
-            }
+    out = _query_candidates(coll, query_text, k, snippet_len)
+
+    with _RESULT_CACHE_LOCK:
+        _RESULT_CACHE[key] = out
+        if len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+    return list(out)
+
+
+def _query_candidates(coll, query_text: str, k: int, snippet_len: int) -> List[Dict[str, Any]]:
+    query_emb = embed_query(query_text)
+
+    index = _dense_index(coll)
+    if index is not None:
+        ids, metas, dists = _dense_query(index, query_emb, k)
+    else:
+        res = coll.query(
+            query_embeddings=[query_emb],
+            n_results=k * _RERANK_OVERSAMPLE,
+            include=["metadatas", "embeddings"],
         )
 
-    return out
+        ids = (res.get("ids") or [[]])[0]
+        metas = (res.get("metadatas") or [[]])[0]
+        embs = res.get("embeddings")
+        embs = embs[0] if embs is not None and len(embs) else []
+        ids, metas, dists = _rerank(query_emb, ids, metas, embs, k)
+
+    # metas/dists may be shorter than ids (or empty); pad with None
+    return [
+        _to_candidate(doc_id, meta, dist, snippet_len)
+        for doc_id, meta, dist in zip_longest(ids, metas, dists)
+        if doc_id is not None
+    ]
+
+
+def _to_candidate(doc_id: str, meta: Any, dist: Optional[float], snippet_len: int) -> Dict[str, Any]:
+    meta = meta if isinstance(meta, dict) else {}
+    snippet = meta.get("snippet") or ""
+    # stored snippets are already cut to SNIPPET_LEN (+ "..."); only shorter requests re-trim
+    if snippet_len < SNIPPET_LEN:
+        body = snippet[:-3] if snippet.endswith("...") else snippet
+        if len(body) > snippet_len:
+            snippet = make_snippet(body, max_len=snippet_len)
+    return {
+        "title": meta.get("title") or doc_id,
+        "snippet": snippet,
+        "distance": dist,
+        "id": doc_id,
+    }
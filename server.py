@@ -1,23 +1,58 @@
 from __future__ import annotations
+import asyncio
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
+from urllib.parse import quote
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import BackgroundTasks, FastAPI, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from db import load_books_into_chroma
+from pydantic import BaseModel
+from db import load_books_into_chroma, load_recommendation_cache
 from rag import retrieval_candidates
 from llm import make_llm_recommendation
 from moderation import moderate_or_pass
-from image_generation import generate_image_to_file, prompt_from_book
+from image_generation import default_image_size, generate_image_to_file, prompt_from_book
 from audio_io import tts_save_to_file, transcribe_file
 import uvicorn
 
 load_dotenv()
 
-app = FastAPI(title="SmartLibrarian API")
+# Chroma collections, loaded at startup
+coll = None
+rec_cache = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global coll, rec_cache
+    # load or create the Chroma collections without blocking the event loop
+    coll = await asyncio.to_thread(load_books_into_chroma)
+    await asyncio.to_thread(_sweep_job_files)
+    # several workers would all write the on-disk rec_cache, which the embedded
+    # Chroma client cannot do safely across processes: skip the cache there
+    if int(os.getenv("SL_WORKERS", "1")) <= 1:
+        rec_cache = await asyncio.to_thread(load_recommendation_cache)
+
+    # one throwaway query opens the OpenAI connection and builds the search
+    # index, so the first real /api/chat does not pay for either
+    try:
+        await asyncio.to_thread(retrieval_candidates, coll, "warmup", k=1)
+    except Exception as e:
+        print(f"[WARN] Startup warm-up failed: {e}")
+    yield
+
+
+app = FastAPI(title="SmartLibrarian API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,35 +71,180 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+_IMAGE_MODEL = "gpt-image-1"
+
 # generated media goes into a static/ directory:
 STATIC_ROOT = Path("static")
 STATIC_ROOT.mkdir(parents=True, exist_ok=True)
 
-# load or create Chroma collection
-coll = load_books_into_chroma()
+# copy uploads in 1 MiB chunks instead of shutil's 16-64 KiB default
+_UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# bookkeeping for media jobs, outside the served STATIC_ROOT (but on the same
+# filesystem, so os.replace into it stays atomic):
+#  - JOBS_ROOT: status markers of queued/failed jobs, one "<job id>.json" per job
+#    (job id = output file name), on disk so every worker process sees them.
+#    Finished jobs have no marker: their file in STATIC_ROOT is the result.
+#  - RENDER_ROOT: files being rendered, renamed into STATIC_ROOT when complete
+WORK_ROOT = Path(".media_jobs")
+JOBS_ROOT = WORK_ROOT / "status"
+RENDER_ROOT = WORK_ROOT / "render"
+JOBS_ROOT.mkdir(parents=True, exist_ok=True)
+RENDER_ROOT.mkdir(parents=True, exist_ok=True)
+
+# a job still pending after this long is assumed lost (e.g. its worker was killed)
+_JOB_TIMEOUT_S = 600
+
+
+_SAFE_NAME_TABLE = str.maketrans({" ": "_", "/": "_", "\\": "_"})
 
 
 def _safe_name(name: str) -> str:
-    return (
-        name.strip()
-        .replace(" ", "_")
-        .replace("/", "_")
-        .replace("\\", "_")
-        .lower()
-    )
+    return name.strip().translate(_SAFE_NAME_TABLE).lower()
+
+
+def _content_key(*parts: str) -> str:
+    """
+    Short stable hash of the inputs a generated media file depends on.
+    """
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def _generate_once(target: Path, render: Callable[[str], object]) -> None:
+    """
+    Create target by calling render(tmp_path), unless it already exists.
+
+    Rendering goes to a temporary file in RENDER_ROOT that is renamed into place,
+    so a failed or half-written file is never served or mistaken for a cached one.
+    """
+    if target.exists():
+        return
+    tmp = RENDER_ROOT / f"{target.stem}.{uuid.uuid4().hex}{target.suffix}"
+    try:
+        render(str(tmp))
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _sweep_job_files() -> None:
+    """
+    Delete markers and partial renders older than the job timeout, e.g. left
+    behind by a killed worker or by jobs that failed long ago.
+    """
+    cutoff = time.time() - _JOB_TIMEOUT_S
+    for path in [*JOBS_ROOT.iterdir(), *RENDER_ROOT.iterdir()]:
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def _marker_path(job_id: str) -> Path:
+    return JOBS_ROOT / f"{job_id}.json"
+
+
+def _write_marker(job_id: str, state: dict) -> None:
+    marker = _marker_path(job_id)
+    tmp = RENDER_ROOT / f"{marker.name}.{uuid.uuid4().hex}"
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, marker)
+
 
-@app.post("/api/chat")
-def chat(payload: dict):
-    user_q = (payload or {}).get("user_q", "").strip()
+def _run_job(job_id: str, target: Path, render: Callable[[str], object]) -> None:
+    try:
+        _generate_once(target, render)
+        _marker_path(job_id).unlink(missing_ok=True)
+    except Exception as e:
+        _write_marker(job_id, {"status": "error", "error": str(e)})
+
+
+def _job_status(job_id: str) -> Optional[dict]:
+    """
+    Current state of a media job, or None if the id is unknown.
+
+    State lives on disk (output file or status marker), so any worker process
+    can answer for a job another worker is running.
+    """
+    if (STATIC_ROOT / job_id).is_file():
+        return {"job_id": job_id, "status": "done", "url": f"/static/{quote(job_id)}"}
+    marker = _marker_path(job_id)
+    try:
+        job = json.loads(marker.read_text(encoding="utf-8"))
+        age = time.time() - marker.stat().st_mtime
+    except (OSError, ValueError):
+        return None
+    if job.get("status") == "pending" and age > _JOB_TIMEOUT_S:
+        job = {"status": "error", "error": "job timed out"}
+    return {"job_id": job_id, **job}
+
+
+def _submit_job(background_tasks: BackgroundTasks, target: Path, render: Callable[[str], object]) -> dict:
+    """
+    Queue generation of target (unless it exists or is already queued) and return its status.
+    """
+    job_id = target.name
+    current = _job_status(job_id)
+    if current is None or current["status"] == "error":
+        # mark the job pending before queueing it, so it is visible from the first poll
+        _write_marker(job_id, {"status": "pending"})
+        background_tasks.add_task(_run_job, job_id, target, render)
+    return {**_job_status(job_id), "status_url": f"/api/jobs/{quote(job_id)}"}
+
+
+class ChatIn(BaseModel):
+    user_q: str
+
+
+class ImageIn(BaseModel):
+    title: str
+    summary: str
+
+
+class TTSIn(BaseModel):
+    text: str
+    book_title: Optional[str] = None
+
+
+# response models let FastAPI serialise straight to JSON bytes with pydantic,
+# skipping the jsonable_encoder + json.dumps path
+class ChatOut(BaseModel):
+    answer: str
+    chosen_title: Optional[str] = None
+    summary: Optional[str] = None
+
+
+class JobOut(BaseModel):
+    job_id: str
+    status: str
+    url: Optional[str] = None
+    error: Optional[str] = None
+    status_url: Optional[str] = None
+
+
+class STTOut(BaseModel):
+    text: str
+
+
+@app.post("/api/chat", response_model=ChatOut)
+async def chat(body: ChatIn):
+    user_q = body.user_q.strip()
     if not user_q:
         return JSONResponse({"answer": "Întrebare goală."}, status_code=400)
 
-    warn = moderate_or_pass(user_q)
+    # moderation and retrieval are independent round trips: run them concurrently
+    # and drop the candidates if the message gets flagged
+    warn, cands = await asyncio.gather(
+        asyncio.to_thread(moderate_or_pass, user_q),
+        asyncio.to_thread(retrieval_candidates, coll, user_q, k=5),
+    )
     if warn:
         return {"answer": warn}
 
-    cands = retrieval_candidates(coll, user_q, k=5)
-    answer, title, summary = make_llm_recommendation(user_q, cands)
+    answer, title, summary = await asyncio.to_thread(
+        make_llm_recommendation, user_q, cands, cache_coll=rec_cache
+    )
     return {
         "answer": answer,
         "chosen_title": title,
@@ -72,54 +252,70 @@ def chat(payload: dict):
     }
 
 
-@app.post("/api/image")
-def image(payload: dict):
-    title = (payload or {}).get("title") or ""
-    summary = (payload or {}).get("summary") or ""
+@app.post("/api/image", response_model=JobOut, response_model_exclude_none=True)
+async def image(body: ImageIn, background_tasks: BackgroundTasks):
+    title, summary = body.title, body.summary
     if not title or not summary:
         return JSONResponse({"error": "title & summary are required"}, status_code=400)
 
+    # size and model are part of the key so changing SL_IMG_SIZE doesn't serve stale images
+    size = default_image_size()
     safe_title = _safe_name(title)
-    out_path = STATIC_ROOT / f"{safe_title}.png"
+    out_path = STATIC_ROOT / f"{safe_title}_{_content_key(title, summary, size, _IMAGE_MODEL)}.png"
 
     prompt = prompt_from_book(title, summary)
-    generate_image_to_file(prompt=prompt, out_path=str(out_path), size="1024x1024", model="gpt-image-1")
-    return {"image_url": f"/{out_path.name}"}
+    return _submit_job(
+        background_tasks,
+        out_path,
+        lambda tmp: generate_image_to_file(prompt=prompt, out_path=tmp, size=size, model=_IMAGE_MODEL),
+    )
 
 
-@app.post("/api/tts")
-def tts(payload: dict):
-    text = (payload or {}).get("text", "").strip()
-    book_title = (payload or {}).get("book_title")
+@app.post("/api/tts", response_model=JobOut, response_model_exclude_none=True)
+async def tts(body: TTSIn, background_tasks: BackgroundTasks):
+    text = body.text.strip()
+    book_title = body.book_title
     if not text:
         return JSONResponse({"error": "text is required"}, status_code=400)
 
-    if book_title:
-        base = Path(_safe_name(book_title)).stem
-        final_name = f"{base}.mp3"
-    else:
-        final_name = "default.mp3"
+    base = Path(_safe_name(book_title)).stem if book_title else "default"
+    final_name = f"{base}_{_content_key(text)}.mp3"
 
     target = STATIC_ROOT / final_name
-    tmp_path_str = tts_save_to_file(text=text, book_title=final_name)
-    tmp_path = Path(tmp_path_str)
-    if tmp_path.resolve() != target.resolve():
-        target.write_bytes(tmp_path.read_bytes())
+    return _submit_job(
+        background_tasks,
+        target,
+        lambda tmp: tts_save_to_file(text=text, book_title=final_name, out_path=tmp),
+    )
 
-    return {"audio_url": f"/{target.name}"}
 
+@app.get("/api/jobs/{job_id}", response_model=JobOut, response_model_exclude_none=True)
+async def job_status(job_id: str):
+    # job ids are plain file names inside STATIC_ROOT
+    status = None
+    if job_id == Path(job_id).name and not job_id.startswith("."):
+        status = _job_status(job_id)
+    if status is None:
+        return JSONResponse({"error": "unknown job"}, status_code=404)
+    return status
 
-@app.post("/api/stt")
-def stt(file: UploadFile = File(...), language: Optional[str] = Form(None)):
-    import tempfile, shutil
 
+def _save_upload(file: UploadFile) -> str:
+    """
+    Copy an uploaded file to a named temporary file and return its path.
+    """
     suffix = Path(file.filename or "").suffix or ".wav"
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+        shutil.copyfileobj(file.file, tmp, length=_UPLOAD_CHUNK_SIZE)
+        return tmp.name
+
+
+@app.post("/api/stt", response_model=STTOut)
+async def stt(file: UploadFile = File(...), language: Optional[str] = Form(None)):
+    tmp_path = await asyncio.to_thread(_save_upload, file)
 
     try:
-        text = transcribe_file(tmp_path, language=language)
+        text = await asyncio.to_thread(transcribe_file, tmp_path, language=language)
         return {"text": text}
     finally:
         try:
@@ -128,7 +324,22 @@ def stt(file: UploadFile = File(...), language: Optional[str] = Form(None)):
             pass
 
 
-app.mount("/", StaticFiles(directory=str(STATIC_ROOT), html=True), name="root")
+app.mount("/static", StaticFiles(directory=str(STATIC_ROOT), html=True), name="static")
 
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=2050, reload=True)
+    # ENV=prod: one worker per core on uvloop/httptools, no file watching
+    prod = os.getenv("ENV") == "prod"
+    workers = (os.cpu_count() or 1) if prod else 1
+    if workers > 1:
+        # the embedded Chroma store is not multi-process safe: ingest here, once,
+        # so the workers' startup only finds an up-to-date collection
+        load_books_into_chroma()
+        os.environ["SL_WORKERS"] = str(workers)
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=2050,
+        reload=not prod,
+        workers=workers,
+        **({"loop": "uvloop", "http": "httptools"} if prod else {}),
+    )